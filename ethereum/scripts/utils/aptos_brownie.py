@@ -1,12 +1,17 @@
 from __future__ import annotations
 
 import abc
+import asyncio
 import functools
 import hashlib
 import os
+import pickle
+import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Union, List, Dict, Any
+from typing import Union, List, Dict, Any, Callable, Tuple
 
 from aptos_sdk import account
 from aptos_sdk.account_address import AccountAddress
@@ -19,11 +24,25 @@ from dotenv import load_dotenv
 from aptos_sdk.account import Account
 from aptos_sdk.client import RestClient, FaucetClient, ApiError
 
+import httpx
 import yaml
 import toml
 
 Tag = Union[BoolTag, U8Tag, U64Tag, U128Tag, AccountAddressTag, StructTag]
 
+# Bump when the pickled layout of EntryFunctionABI changes
+ABIS_CACHE_VERSION = 1
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_struct_tag(s: str) -> StructTag:
+    return StructTag.from_str(s)
+
+
+@functools.lru_cache(maxsize=4096)
+def _type_tag_from_str(s: str) -> TypeTag:
+    return TypeTag(_parse_struct_tag(s))
+
 
 class VectorTag(metaclass=abc.ABCMeta):
     value: List[Tag]
@@ -47,7 +66,6 @@ class VectorTag(metaclass=abc.ABCMeta):
 
 class VectorBoolTag(VectorTag):
     def __init__(self, value):
-        assert isinstance(list(value), list), "value must sequence"
         super().__init__([BoolTag(v) for v in value])
 
     def deserialize(deserializer: Deserializer) -> VectorBoolTag:
@@ -55,17 +73,26 @@ class VectorBoolTag(VectorTag):
 
 
 class VectorU8Tag(VectorTag):
+    value: bytes
+
     def __init__(self, value):
-        assert isinstance(list(value), list), "value must sequence"
-        super().__init__([U8Tag(v) for v in value])
+        # Stored as a single bytes object rather than one U8Tag per byte
+        assert not isinstance(value, int), "value must sequence"
+        if isinstance(value, str):
+            # "0x..." hex string, as accepted by the json api
+            value = bytes.fromhex(value[2:] if value.startswith("0x") else value)
+        super().__init__(bytes(value))
 
     def deserialize(deserializer: Deserializer) -> VectorU8Tag:
-        return deserializer.sequence(U8Tag.deserialize)
+        return VectorU8Tag(deserializer.bytes())
+
+    def serialize(self, serializer: Serializer):
+        # uleb128 length followed by the raw bytes, same encoding as a sequence of u8
+        serializer.bytes(self.value)
 
 
 class VectorU64Tag(VectorTag):
     def __init__(self, value):
-        assert isinstance(list(value), list), "value must sequence"
         super().__init__([U64Tag(v) for v in value])
 
     def deserialize(deserializer: Deserializer) -> VectorU64Tag:
@@ -74,7 +101,6 @@ class VectorU64Tag(VectorTag):
 
 class VectorU128Tag(VectorTag):
     def __init__(self, value):
-        assert isinstance(list(value), list), "value must sequence"
         super().__init__([U128Tag(v) for v in value])
 
     def deserialize(deserializer: Deserializer) -> VectorU128Tag:
@@ -83,7 +109,6 @@ class VectorU128Tag(VectorTag):
 
 class VectorAccountAddressTag(VectorTag):
     def __init__(self, value):
-        assert isinstance(list(value), list), "value must sequence"
         super().__init__([AccountAddressTag(v) for v in value])
 
     def deserialize(deserializer: Deserializer) -> VectorAccountAddressTag:
@@ -92,13 +117,33 @@ class VectorAccountAddressTag(VectorTag):
 
 class VectorStructTag(VectorTag):
     def __init__(self, value):
-        assert isinstance(list(value), list), "value must sequence"
-        super().__init__([StructTag.from_str(v) for v in value])
+        super().__init__([_parse_struct_tag(v) for v in value])
 
     def deserialize(deserializer: Deserializer) -> VectorStructTag:
         return deserializer.sequence(StructTag.deserialize)
 
 
+# TypeTag.SIGNER and nested vectors are not supported
+_TAG_TABLE = {
+    TypeTag.BOOL: BoolTag,
+    TypeTag.U8: U8Tag,
+    TypeTag.U64: U64Tag,
+    TypeTag.U128: U128Tag,
+    TypeTag.ACCOUNT_ADDRESS: AccountAddressTag,
+    TypeTag.VECTOR: VectorTag,
+    TypeTag.STRUCT: StructTag,
+}
+
+_VECTOR_TAG_TABLE = {
+    BoolTag: VectorBoolTag,
+    U8Tag: VectorU8Tag,
+    U64Tag: VectorU64Tag,
+    U128Tag: VectorU128Tag,
+    AccountAddressTag: VectorAccountAddressTag,
+    StructTag: VectorStructTag,
+}
+
+
 class ArgumentABI:
     name: str
     type_tag: type(Tag)
@@ -118,41 +163,17 @@ class ArgumentABI:
 
     @staticmethod
     def get_tag(variant: int):
-        if variant == TypeTag.BOOL:
-            return BoolTag
-        elif variant == TypeTag.U8:
-            return U8Tag
-        elif variant == TypeTag.U64:
-            return U64Tag
-        elif variant == TypeTag.U128:
-            return U128Tag
-        elif variant == TypeTag.ACCOUNT_ADDRESS:
-            return AccountAddressTag
-        elif variant == TypeTag.SIGNER:
+        try:
+            return _TAG_TABLE[variant]
+        except KeyError:
             raise NotImplementedError
-        elif variant == TypeTag.VECTOR:
-            return VectorTag
-        elif variant == TypeTag.STRUCT:
-            return StructTag
-        raise NotImplementedError
 
     @staticmethod
     def get_vector_tag(tag):
-        if tag == BoolTag:
-            return VectorBoolTag
-        elif tag == U8Tag:
-            return VectorU8Tag
-        elif tag == U64Tag:
-            return VectorU64Tag
-        elif tag == U128Tag:
-            return VectorU128Tag
-        elif tag == AccountAddressTag:
-            return VectorAccountAddressTag
-        elif tag == VectorTag:
+        try:
+            return _VECTOR_TAG_TABLE[tag]
+        except KeyError:
             raise NotImplementedError
-        elif tag == StructTag:
-            return VectorStructTag
-        raise NotImplementedError
 
     def deserialize(deserializer: Deserializer) -> ArgumentABI:
         name = deserializer.str()
@@ -170,6 +191,7 @@ class EntryFunctionABI:
     doc: str
     ty_args: List[str]
     args: List[ArgumentABI]
+    arg_builders: List[Callable[[Any], Any]]
 
     def __init__(self, name, module, doc, ty_args, args):
         self.name = name
@@ -177,6 +199,11 @@ class EntryFunctionABI:
         self.doc = doc
         self.ty_args = ty_args
         self.args = args
+        # Bind each argument to its constructor once, instead of checking the type on every call
+        self.arg_builders = [
+            _parse_struct_tag if arg.type_tag == StructTag else arg.type_tag
+            for arg in args
+        ]
 
     def key(self):
         return f"{self.module.name}::{self.name}"
@@ -240,8 +267,18 @@ class AptosPackage:
         self.network_config = self.config["networks"][network]
         self.rest_client = RestClient(
             self.config["networks"][network]["node_url"])
+        # Keep connections to the node alive across submit/poll requests
+        self.rest_client.client.close()
+        self.rest_client.client = self.create_http_client()
         self.faucet_client = FaucetClient(
             self.config["networks"][network]["faucet_url"], self.rest_client)
+        # Next sequence number per sender, advanced locally after each accepted submit.
+        # The chain id is already fetched once by RestClient.
+        self._next_seq: Dict[str, int] = {}
+        self._seq_locks: Dict[str, threading.Lock] = {}
+        self._seq_locks_guard = threading.Lock()
+        # txn hash -> (sender, sequence number) until wait_for_transaction sees it
+        self._submitted_seq: Dict[str, Tuple[str, int]] = {}
 
         # # # # # load move toml
         assert self.package_path.joinpath(
@@ -253,78 +290,130 @@ class AptosPackage:
         self.package_name = self.move_toml["package"]["name"]
 
         # # # # # Replace address
-        self.replace_address = ""
-        has_replace = {}
+        self.named_addresses: List[str] = []
+        has_replace = set()
         if "addresses" in self.move_toml:
             if "replace_address" in self.network_config:
-                for k in self.network_config["replace_address"]:
+                for k, v in self.network_config["replace_address"].items():
                     if k in has_replace:
                         continue
-                    if len(self.replace_address) == 0:
-                        self.replace_address = f"--named-addresses {k}={self.network_config['replace_address'][k]}"
-                    else:
-                        self.replace_address += f',{k}={self.network_config["replace_address"][k]}'
-                    has_replace[k] = True
+                    self.named_addresses.append(f"{k}={v}")
+                    has_replace.add(k)
             for k in self.move_toml["addresses"]:
                 if k in has_replace:
                     continue
                 if self.move_toml["addresses"][k] == "_":
-                    if len(self.replace_address) == 0:
-                        self.replace_address = f"--named-addresses {k}={self.account.account_address}"
-                    else:
-                        self.replace_address += f',{k}={self.account.account_address}'
+                    self.named_addresses.append(f"{k}={self.account.account_address}")
+        if len(self.named_addresses):
+            self.replace_address = "--named-addresses " + ",".join(self.named_addresses)
+        else:
+            self.replace_address = ""
 
         if is_compile:
             self.compile()
 
+    def _named_addresses_argv(self) -> List[str]:
+        if len(self.named_addresses) == 0:
+            return []
+        return ["--named-addresses", ",".join(self.named_addresses)]
+
+    @staticmethod
+    def create_http_client() -> httpx.Client:
+        limits = httpx.Limits(max_keepalive_connections=16, keepalive_expiry=60)
+        try:
+            return httpx.Client(http2=True, limits=limits)
+        except ImportError:
+            # http2 needs the optional h2 package
+            return httpx.Client(limits=limits)
+
     def compile(self):
         # # # # # Compile
         view = f"Compile {self.package_name}"
         print("\n" + "-" * 50 + view + "-" * 50)
-        compile_cmd = f"aptos move compile --included-artifacts all --save-metadata --package-dir " \
-                      f"{self.package_path} {self.replace_address}"
-        print(compile_cmd)
-        os.system(compile_cmd)
+        compile_cmd = ["aptos", "move", "compile", "--included-artifacts", "all", "--save-metadata",
+                       "--package-dir", str(self.package_path), *self._named_addresses_argv()]
+        print(" ".join(compile_cmd))
+        subprocess.run(compile_cmd, check=True)
         print("-" * (100 + len(view)))
         print("\n")
 
         # # # # # Metadata
         self.build_path = self.package_path.joinpath(
             f"build/{self.package_name}")
-        with open(self.build_path.joinpath(f"package-metadata.bcs"), "rb") as f:
-            self.package_metadata = f.read()
+        self.package_metadata = self.build_path.joinpath(
+            "package-metadata.bcs").read_bytes()
 
         # # # # # Bytecode
-        self.move_module_files = []
-        bytecode_modules = self.build_path.joinpath("bytecode_modules")
-        for m in os.listdir(bytecode_modules):
-            if str(m).endswith(".mv"):
-                self.move_module_files.append(
-                    bytecode_modules.joinpath(str(m)))
-        self.move_modules = []
-        for m in self.move_module_files:
-            with open(m, "rb") as f:
-                self.move_modules.append(f.read())
+        self.move_module_files = list(
+            self.build_path.joinpath("bytecode_modules").glob("*.mv"))
+        self.move_modules = [m.read_bytes() for m in self.move_module_files]
 
         # # # # # Abis
         self.abis_path = self.build_path.joinpath("abis")
         self.abis = {}
         if self.abis_path.exists():
-            for v1 in os.listdir(self.abis_path):
-                module_abi_path = self.abis_path.joinpath(str(v1))
-                if not module_abi_path.is_dir():
-                    continue
-                for v2 in os.listdir(module_abi_path):
-                    if not str(v2).endswith(".abi"):
-                        continue
-                    with open(module_abi_path.joinpath(str(v2)), "rb") as f:
-                        data = f.read()
-                        try:
-                            abi = EntryFunctionABI.deserialize(
-                                Deserializer(data))
-                            self.abis[abi.key()] = abi
-                        except:
-                            print(f"Decode {v2} fail")
+            # Reuse abis decoded by previous runs, keyed by (mtime, sha256) of each file
+            abis_cache_path = self.build_path.joinpath("abis.cache.pkl")
+            cache_files, cache_abis = self.load_abis_cache(abis_cache_path)
+            # abis/<module>/<function>.abi
+            abi_files = list(self.abis_path.glob("*/*.abi"))
+
+            # Overlap file reads of the abis
+            files = {}
+            abis = {}
+            if len(abi_files):
+                with ThreadPoolExecutor(max_workers=min(32, len(abi_files))) as executor:
+                    results = executor.map(
+                        functools.partial(self.load_abi, cache_files=cache_files, cache_abis=cache_abis),
+                        abi_files)
+                    for result in results:
+                        if result is None:
+                            continue
+                        key, stamp, abi = result
+                        files[key] = stamp
+                        abis[key] = abi
+            for abi in abis.values():
+                self.abis[abi.key()] = abi
+            if files != cache_files:
+                self.dump_abis_cache(abis_cache_path, files, abis)
+
+    @staticmethod
+    def load_abi(abi_file: Path, cache_files: dict, cache_abis: dict):
+        key = str(abi_file)
+        mtime = abi_file.stat().st_mtime
+        if key in cache_files and cache_files[key][0] == mtime:
+            return key, cache_files[key], cache_abis[key]
+        data = abi_file.read_bytes()
+        digest = hashlib.sha256(data).digest()
+        if key in cache_files and cache_files[key][1] == digest:
+            return key, (mtime, digest), cache_abis[key]
+        try:
+            abi = EntryFunctionABI.deserialize(Deserializer(data))
+            return key, (mtime, digest), abi
+        except:
+            print(f"Decode {abi_file.name} fail")
+            return None
+
+    @staticmethod
+    def load_abis_cache(cache_path: Path):
+        if not cache_path.exists():
+            return {}, {}
+        try:
+            with open(cache_path, "rb") as f:
+                cache = pickle.load(f)
+            if cache.get("version") != ABIS_CACHE_VERSION:
+                return {}, {}
+            return cache["files"], cache["abis"]
+        except Exception:
+            return {}, {}
+
+    @staticmethod
+    def dump_abis_cache(cache_path: Path, files: dict, abis: dict):
+        try:
+            with open(cache_path, "wb") as f:
+                pickle.dump({"version": ABIS_CACHE_VERSION, "files": files, "abis": abis}, f)
+        except Exception as e:
+            print(f"Save abis cache fail: {e}")
 
     def publish_package(self):
         # # Sometimes: "Transaction Executed and Committed with Error LINKER_ERROR"
@@ -334,10 +423,13 @@ class AptosPackage:
         # print(f"Publish package: {self.package_name} Success.\n")
         view = f"Publish {self.package_name}"
         print("\n" + "-" * 50 + view + "-" * 50)
-        compile_cmd = f"aptos move publish --assume-yes {self.replace_address} --package-dir {self.package_path} " \
-                      f"--url {self.network_config['node_url']} " \
-                      f"--private-key {self.account.private_key}"
-        os.system(compile_cmd)
+        compile_cmd = ["aptos", "move", "publish", "--assume-yes", *self._named_addresses_argv(),
+                       "--package-dir", str(self.package_path),
+                       "--url", self.network_config["node_url"],
+                       "--private-key", str(self.account.private_key)]
+        subprocess.run(compile_cmd)
+        # The cli submitted with this account behind our back
+        self._drop_sequence_number(str(self.account.address()))
         print("-" * (100 + len(view)))
         print("\n")
 
@@ -346,11 +438,14 @@ class AptosPackage:
         return functools.partial(self.submit_bcs_transaction, self.abis[key])
 
     def create_single_signer_bcs_transaction(
-            self, sender: Account, payload: TransactionPayload, gas: int = 500000, gas_price: int = 100
+            self, sender: Account, payload: TransactionPayload, gas: int = 500000, gas_price: int = 100,
+            sequence_number: int = None
     ) -> SignedTransaction:
+        if sequence_number is None:
+            sequence_number = self.rest_client.account_sequence_number(sender.address())
         raw_transaction = RawTransaction(
             sender.address(),
-            self.rest_client.account_sequence_number(sender.address()),
+            sequence_number,
             payload,
             gas,
             gas_price,
@@ -364,59 +459,101 @@ class AptosPackage:
         )
         return SignedTransaction(raw_transaction, authenticator)
 
-    def submit_bcs_transaction(
-            self, abi: EntryFunctionABI, *args, ty_args: List[str] = None, **kwargs,
-    ) -> dict:
-        if ty_args is None:
-            ty_args = []
-        assert isinstance(list(ty_args), list) and len(
+    def sequence_number(self, address: AccountAddress) -> int:
+        key = str(address)
+        if key not in self._next_seq:
+            self._next_seq[key] = self.rest_client.account_sequence_number(address)
+        return self._next_seq[key]
+
+    def _sequence_lock(self, key: str) -> threading.Lock:
+        with self._seq_locks_guard:
+            if key not in self._seq_locks:
+                self._seq_locks[key] = threading.Lock()
+            return self._seq_locks[key]
+
+    def _drop_sequence_number(self, key: str):
+        with self._sequence_lock(key):
+            self._next_seq.pop(key, None)
+
+    def submit_bcs_payload(
+            self, sender: Account, payload: TransactionPayload, sequence_number: int = None
+    ) -> str:
+        """Signs and submits payload with the cached sequence number,
+        refetching it once if the node rejects it as stale.
+
+        Thread safe: reading, signing, submitting and advancing the sequence number
+        happen under a per-sender lock, so concurrent submits for one sender get
+        consecutive numbers. sequence_number only seeds the cache when it is empty.
+        """
+        key = str(sender.address())
+        with self._sequence_lock(key):
+            if sequence_number is not None and key not in self._next_seq:
+                self._next_seq[key] = sequence_number
+            signed_transaction = self.create_single_signer_bcs_transaction(
+                sender, payload, sequence_number=self.sequence_number(sender.address()))
+            try:
+                txn_hash = self.rest_client.submit_bcs_transaction(signed_transaction)
+            except ApiError as e:
+                self._next_seq.pop(key, None)
+                if "SEQUENCE_NUMBER" not in str(e):
+                    raise e
+                signed_transaction = self.create_single_signer_bcs_transaction(
+                    sender, payload, sequence_number=self.sequence_number(sender.address()))
+                txn_hash = self.rest_client.submit_bcs_transaction(signed_transaction)
+            self._next_seq[key] = signed_transaction.transaction.sequence_number + 1
+            self._submitted_seq[txn_hash] = (key, signed_transaction.transaction.sequence_number)
+        return txn_hash
+
+    def _normalize_args(
+            self, abi: EntryFunctionABI, args: tuple, ty_args: List[str], kwargs: dict, for_json: bool = False,
+    ) -> list:
+        """Checks args (or kwargs) against abi and returns them in abi order,
+        as tag values for bcs or as raw values for the json payload."""
+        assert isinstance(ty_args, (list, tuple)) and len(
             abi.ty_args) == len(ty_args), f"ty_args error: {abi.ty_args}"
         assert len(args) == len(abi.args) or len(
             kwargs) == len(abi.args), f"args error: {abi.args}"
 
-        normal_args = []
         if len(kwargs):
             for function_arg in abi.args:
                 assert function_arg.name in kwargs, f"Param {function_arg.name} not found"
-                if function_arg.type_tag == StructTag:
-                    assert StructTag.from_str(
-                        kwargs[function_arg.name]), f"Param {function_arg} not match"
-                    value = StructTag.from_str(kwargs[function_arg.name])
-                else:
-                    assert function_arg.type_tag(
-                        kwargs[function_arg.name]), f"Param {function_arg} not match"
-                    value = function_arg.type_tag(kwargs[function_arg.name])
-                normal_args.append({
-                    "value": value,
-                    "abi": function_arg})
-        else:
-            for i, function_arg in enumerate(abi.args):
-                if function_arg.type_tag == StructTag:
-                    assert StructTag.from_str(
-                        args[i]), f"Param {function_arg} not match"
-                    value = StructTag.from_str(args[i])
-                else:
-                    assert function_arg.type_tag(
-                        args[i]), f"Param {function_arg} not match"
-                    value = function_arg.type_tag(args[i])
-
-                normal_args.append({
-                    "value": value,
-                    "abi": function_arg})
+            args = [kwargs[function_arg.name] for function_arg in abi.args]
 
+        normal_args = []
+        for i, function_arg in enumerate(abi.args):
+            value = abi.arg_builders[i](args[i])
+            assert value, f"Param {function_arg} not match"
+            if for_json:
+                value = args[i]
+                if isinstance(value, list):
+                    value = "0x" + str(bytes(value).hex())
+            normal_args.append(value)
+        return normal_args
+
+    def build_bcs_payload(
+            self, abi: EntryFunctionABI, args: tuple, ty_args: List[str] = None, kwargs: dict = None,
+    ) -> TransactionPayload:
+        if kwargs is None:
+            kwargs = {}
+        if ty_args is None:
+            ty_args = []
+        normal_args = self._normalize_args(abi, args, ty_args, kwargs)
         payload = EntryFunction.natural(
             str(abi.module),
             str(abi.name),
-            [TypeTag(StructTag.from_str(v)) for v in ty_args],
+            [_type_tag_from_str(v) for v in ty_args],
             [
-                TransactionArgument(arg["value"], Serializer.struct)
-                for arg in normal_args
+                TransactionArgument(value, Serializer.struct)
+                for value in normal_args
             ],
         )
-        signed_transaction = self.create_single_signer_bcs_transaction(
-            self.account, TransactionPayload(payload)
-        )
-        txn_hash = self.rest_client.submit_bcs_transaction(signed_transaction)
+        return TransactionPayload(payload)
+
+    def submit_bcs_transaction(
+            self, abi: EntryFunctionABI, *args, ty_args: List[str] = None, **kwargs,
+    ) -> dict:
+        payload = self.build_bcs_payload(abi, args, ty_args, kwargs)
+        txn_hash = self.submit_bcs_payload(self.account, payload)
         print(
             f"Execute {abi.module.name}::{abi.name}, transaction hash: {txn_hash}, waiting...")
         response = self.wait_for_transaction(txn_hash)
@@ -426,6 +563,32 @@ class AptosPackage:
             "response": response
         }
 
+    async def submit_bcs_transaction_async(
+            self, abi: EntryFunctionABI, *args, ty_args: List[str] = None, **kwargs,
+    ) -> dict:
+        """Same as submit_bcs_transaction, but can be awaited concurrently:
+        submits from the same account are serialized by submit_bcs_payload and
+        signed with consecutive sequence numbers."""
+        loop = asyncio.get_running_loop()
+        # Fetch the sequence number in the background while the payload is built
+        sequence_number = None
+        if str(self.account.address()) not in self._next_seq:
+            sequence_number = loop.run_in_executor(
+                None, self.rest_client.account_sequence_number, self.account.address())
+        payload = self.build_bcs_payload(abi, args, ty_args, kwargs)
+        if sequence_number is not None:
+            sequence_number = await sequence_number
+        txn_hash = await loop.run_in_executor(
+            None, self.submit_bcs_payload, self.account, payload, sequence_number)
+        print(
+            f"Execute {abi.module.name}::{abi.name}, transaction hash: {txn_hash}, waiting...")
+        response = await loop.run_in_executor(None, self.wait_for_transaction, txn_hash)
+        print(f"Execute {abi.module.name}::{abi.name} Success.\n")
+        return {
+            "hash": txn_hash,
+            "response": response
+        }
+
     def submit_transaction(self, sender: Account, payload: Dict[str, Any]) -> str:
         """
         1) Generates a transaction request
@@ -434,9 +597,10 @@ class AptosPackage:
         4) submits the signed transaction
         """
 
+        sequence_number = self.rest_client.account_sequence_number(sender.address())
         txn_request = {
             "sender": f"{sender.address()}",
-            "sequence_number": str(self.rest_client.account_sequence_number(sender.address())),
+            "sequence_number": str(sequence_number),
             "max_gas_amount": "500000",
             "gas_unit_price": "100",
             "expiration_timestamp_secs": str(int(time.time()) + 600),
@@ -463,57 +627,23 @@ class AptosPackage:
         )
         if response.status_code >= 400:
             raise ApiError(response.text, response.status_code)
-        return response.json()["hash"]
+        key = str(sender.address())
+        txn_hash = response.json()["hash"]
+        with self._sequence_lock(key):
+            self._next_seq[key] = sequence_number + 1
+            self._submitted_seq[txn_hash] = (key, sequence_number)
+        return txn_hash
 
     def custom_submit_transaction(
             self, abi: EntryFunctionABI, *args, ty_args: List[str] = None, **kwargs,
     ) -> dict:
         if ty_args is None:
             ty_args = []
-        assert isinstance(list(ty_args), list) and len(
-            abi.ty_args) == len(ty_args), f"ty_args error: {abi.ty_args}"
-        assert len(args) == len(abi.args) or len(
-            kwargs) == len(abi.args), f"args error: {abi.args}"
-
-        normal_args = []
-        if len(kwargs):
-            for function_arg in abi.args:
-                assert function_arg.name in kwargs, f"Param {function_arg.name} not found"
-                if function_arg.type_tag == StructTag:
-                    assert StructTag.from_str(
-                        kwargs[function_arg.name]), f"Param {function_arg} not match"
-                    value = StructTag.from_str(kwargs[function_arg.name])
-                else:
-                    assert function_arg.type_tag(
-                        kwargs[function_arg.name]), f"Param {function_arg} not match"
-                    value = function_arg.type_tag(kwargs[function_arg.name])
-                normal_args.append({
-                    "value": value,
-                    "abi": function_arg})
-        else:
-            for i, function_arg in enumerate(abi.args):
-                if function_arg.type_tag == StructTag:
-                    assert StructTag.from_str(
-                        args[i]), f"Param {function_arg} not match"
-                    value = args[i]
-                else:
-                    assert function_arg.type_tag(
-                        args[i]), f"Param {function_arg} not match"
-                    value = args[i]
-                    if isinstance(value, list):
-                        value = "0x" + str(bytes(value).hex())
-
-                normal_args.append({
-                    "value": value,
-                    "abi": function_arg})
         payload = {
             "type": "entry_function_payload",
             "function": f"{str(abi.module)}::{str(abi.name)}",
             "type_arguments": [v for v in ty_args],
-            "arguments": [
-                arg["value"]
-                for arg in normal_args
-            ],
+            "arguments": self._normalize_args(abi, args, ty_args, kwargs, for_json=True),
         }
         txn_hash = self.submit_transaction(self.account, payload)
         print(
@@ -526,15 +656,27 @@ class AptosPackage:
         }
 
     def wait_for_transaction(self, txn_hash: str):
-        """Waits up to 20 seconds for a transaction to move past pending state."""
+        """Waits up to 20 seconds for a transaction to move past pending state.
 
-        count = 0
+        If a transaction we submitted times out (e.g. dropped from mempool) or commits
+        with another sequence number, the sender's cached sequence number is dropped
+        so the next submit refetches it."""
+
+        submitted = self._submitted_seq.pop(txn_hash, None)
+        # Poll quickly first since most transactions confirm well under a second
+        delay = 0.05
+        total = 0
         while self.rest_client.transaction_pending(txn_hash):
-            assert count < 20, f"transaction {txn_hash} timed out"
-            time.sleep(1)
-            count += 1
+            if total >= 20 and submitted is not None:
+                self._drop_sequence_number(submitted[0])
+            assert total < 20, f"transaction {txn_hash} timed out"
+            time.sleep(delay)
+            total += delay
+            delay = min(delay * 1.5, 1.0)
         response = self.rest_client.client.get(
             f"{self.rest_client.base_url}/transactions/by_hash/{txn_hash}")
+        if submitted is not None and str(response.json().get("sequence_number")) != str(submitted[1]):
+            self._drop_sequence_number(submitted[0])
         assert (
                 "success" in response.json() and response.json()["success"]
         ), f"{response.text} - {txn_hash}"
@@ -555,10 +697,7 @@ class AptosPackage:
             transaction_arguments,
         )
 
-        signed_transaction = self.rest_client.create_single_signer_bcs_transaction(
-            sender, TransactionPayload(payload)
-        )
-        return self.rest_client.submit_bcs_transaction(signed_transaction)
+        return self.submit_bcs_payload(sender, TransactionPayload(payload))
 
     def create_random_account(self):
         assert self.network in ["aptos-devnet", "aptos-testnet"]
@@ -593,6 +732,20 @@ class AptosPackage:
         hasher.update(data)
         return "0x" + hasher.digest().hex()
 
+    @staticmethod
+    def batch_get_resource_addr(account_addrs: List[str], seeds: List[str]) -> List[str]:
+        """Same as get_resource_addr for each (account_addr, seed) pair,
+        parsing every distinct account address only once."""
+        assert len(account_addrs) == len(seeds), "account_addrs and seeds length mismatch"
+        addr_bytes = {}
+        result = []
+        for account_addr, seed in zip(account_addrs, seeds):
+            if account_addr not in addr_bytes:
+                addr_bytes[account_addr] = AccountAddress.from_hex(account_addr).address
+            data = addr_bytes[account_addr] + bytes(seed, "ascii") + b"\xff"
+            result.append("0x" + hashlib.sha3_256(data).hexdigest())
+        return result
+
     def account_resource(self,
                          account_addr: Union[str, AccountAddress],
                          resource_type: str